@@ -0,0 +1,245 @@
+import json
+import queue
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, wait
+
+# --- Token Budgeting ---
+# Rough, dependency-free estimate: ~4 characters per token for English legal text
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def compact_json(value):
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+
+def chunk_clauses(clauses, max_tokens):
+    # Greedily pack clauses in document order; a single oversized clause gets its own chunk
+    chunks = []
+    current = []
+    current_tokens = 0
+    for clause in clauses:
+        clause_tokens = estimate_tokens(compact_json(clause))
+        if current and current_tokens + clause_tokens > max_tokens:
+            chunks.append(current)
+            current = []
+            current_tokens = 0
+        current.append(clause)
+        current_tokens += clause_tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+# Read-only context ids are anchored on the body paragraph they follow ("clause_012-t1r2c3p1");
+# header parts have no anchor and go with the first chunk, footer parts with the last
+_ANCHOR_RE = re.compile(r"^clause_(\d+)")
+
+def _anchor(clause_id):
+    match = _ANCHOR_RE.match(clause_id)
+    if match:
+        return int(match.group(1))
+    return float("inf") if clause_id.startswith("footer") else 0
+
+def assign_context(chunks, context_clauses):
+    # Returns one list of read-only clauses per chunk: each goes with the first chunk
+    # whose last body paragraph is at or after its anchor, so prompts carry only
+    # their own surroundings instead of every table in the document
+    assigned = [[] for _ in chunks]
+    if not chunks or not context_clauses:
+        return assigned
+    limits = [_anchor(chunk[-1]["clause_id"]) if chunk else 0 for chunk in chunks]
+    for clause in context_clauses:
+        anchor = _anchor(clause["clause_id"])
+        index = next((i for i, limit in enumerate(limits) if anchor <= limit), len(chunks) - 1)
+        assigned[index].append(clause)
+    return assigned
+
+# --- Concurrent Execution ---
+# Chunks run on a caller-supplied executor shared by every request, so total model
+# concurrency stays bounded no matter how many requests or jobs are in flight.
+# Each chunk's timeout starts when a pool thread picks it up; time spent queued
+# behind other requests doesn't count against it. A timed-out call can't be
+# interrupted and keeps its pool thread until the provider's own timeout fires.
+QUEUED_POLL_SECONDS = 0.05
+
+def _next_wait(pending, starts, chunk_timeout):
+    now = time.monotonic()
+    remaining = [starts[index] + chunk_timeout - now for index in pending if index in starts]
+    wait_for = min(remaining) if remaining else QUEUED_POLL_SECONDS
+    if len(remaining) < len(pending):
+        # Some chunks are still queued; wake up to start their clocks
+        wait_for = min(wait_for, QUEUED_POLL_SECONDS)
+    return max(0, wait_for)
+
+def _expired(pending, starts, chunk_timeout):
+    now = time.monotonic()
+    return sorted(index for index in pending if index in starts and now - starts[index] >= chunk_timeout)
+
+def _timeout_error(chunk_timeout):
+    return TimeoutError(f"Chunk timed out after {chunk_timeout}s")
+
+def run_chunks(worker, chunks, executor, chunk_timeout):
+    # Returns (results, errors) where results[i] is None for a failed or timed-out chunk
+    results = [None] * len(chunks)
+    errors = []
+    starts = {}
+
+    def run(index, chunk):
+        starts[index] = time.monotonic()
+        return worker(chunk)
+
+    futures = {executor.submit(run, i, chunk): i for i, chunk in enumerate(chunks)}
+    pending = set(futures.values())
+    by_index = {index: future for future, index in futures.items()}
+    while pending:
+        done, _ = wait(
+            [by_index[index] for index in pending],
+            timeout=_next_wait(pending, starts, chunk_timeout),
+            return_when=FIRST_COMPLETED,
+        )
+        for future in done:
+            index = futures[future]
+            pending.discard(index)
+            try:
+                results[index] = future.result()
+            except Exception as e:
+                errors.append((index, e))
+        for index in _expired(pending, starts, chunk_timeout):
+            # Don't block the request on stragglers; their results are discarded
+            pending.discard(index)
+            by_index[index].cancel()
+            errors.append((index, _timeout_error(chunk_timeout)))
+    errors.sort(key=lambda item: item[0])
+    return results, errors
+
+def stream_chunks(worker, chunks, executor, chunk_timeout):
+    # Like run_chunks, but worker(chunk, emit) pushes items as they are produced.
+    # Yields ("item", index, item), ("error", index, exception) and ("done", index, None).
+    events = queue.Queue()
+    starts = {}
+
+    def run(index, chunk):
+        starts[index] = time.monotonic()
+        try:
+            worker(chunk, lambda item: events.put(("item", index, item)))
+            events.put(("done", index, None))
+        except Exception as e:
+            events.put(("error", index, e))
+
+    futures = {i: executor.submit(run, i, chunk) for i, chunk in enumerate(chunks)}
+    pending = set(futures)
+    try:
+        while pending:
+            try:
+                kind, index, payload = events.get(timeout=_next_wait(pending, starts, chunk_timeout))
+            except queue.Empty:
+                kind = None
+            if kind is not None and index in pending:
+                if kind != "item":
+                    pending.discard(index)
+                yield kind, index, payload
+            for index in _expired(pending, starts, chunk_timeout):
+                pending.discard(index)
+                futures[index].cancel()
+                yield "error", index, _timeout_error(chunk_timeout)
+    finally:
+        # The client went away or we finished; drop anything that hasn't started yet
+        for future in futures.values():
+            future.cancel()
+
+# --- Incremental Parsing ---
+class SuggestionStreamParser:
+    # Pulls each complete object out of {"suggestions": [ {...}, {...} ]} while the
+    # model is still writing the rest. Only brace depth and string state are tracked,
+    # so markdown fences around the JSON are harmless.
+    def __init__(self):
+        self.text = ""
+        self.emitted = 0
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._object_start = None
+
+    def feed(self, fragment):
+        self.text += fragment
+        objects = []
+        text = self.text
+        for i in range(self._pos, len(text)):
+            char = text[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                self._depth += 1
+                if self._depth == 2:
+                    self._object_start = i
+            elif char == "}":
+                if self._depth == 2 and self._object_start is not None:
+                    try:
+                        objects.append(json.loads(text[self._object_start:i + 1]))
+                    except json.JSONDecodeError:
+                        objects.append(None)
+                    self._object_start = None
+                self._depth -= 1
+        self._pos = len(text)
+        self.emitted += len(objects)
+        return objects
+
+# --- Validation ---
+VALID_ACTIONS = ("MODIFY", "ADD", "REMOVE")
+
+def validate_suggestion(suggestion):
+    # Returns an error message, or None if the suggestion matches the prompt's schema
+    if not isinstance(suggestion, dict):
+        return "Suggestion is not a JSON object."
+    action = suggestion.get("action")
+    if action not in VALID_ACTIONS:
+        return f"Unknown action '{action}'."
+    if not isinstance(suggestion.get("clause_id"), str):
+        return "Missing clause_id."
+    if not isinstance(suggestion.get("reason", ""), str):
+        return "reason must be a string."
+    if action == "MODIFY" and not isinstance(suggestion.get("new_text"), str):
+        return "MODIFY suggestion is missing new_text."
+    if action == "ADD":
+        new_clause = suggestion.get("new_clause")
+        if not isinstance(new_clause, dict) or not isinstance(new_clause.get("text"), str):
+            return "ADD suggestion is missing new_clause.text."
+    return None
+
+# --- Merging ---
+def _clause_position(clause_id, positions):
+    return positions.get(clause_id, len(positions))
+
+def suggestion_key(suggestion):
+    new_clause = suggestion.get("new_clause") or {}
+    return (
+        suggestion.get("action"),
+        suggestion.get("clause_id"),
+        (suggestion.get("new_text") or "").strip(),
+        (new_clause.get("text") or "").strip() if isinstance(new_clause, dict) else "",
+    )
+
+def merge_suggestions(chunk_results, clauses):
+    positions = {clause["clause_id"]: i for i, clause in enumerate(clauses)}
+    merged = []
+    seen = set()
+    for suggestions in chunk_results:
+        for suggestion in suggestions or []:
+            if not isinstance(suggestion, dict):
+                continue
+            key = suggestion_key(suggestion)
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(suggestion)
+    # sorted() is stable, so multiple ADDs after the same anchor keep the model's order
+    return sorted(merged, key=lambda s: _clause_position(s.get("clause_id"), positions))
@@ -0,0 +1,197 @@
+"""Offline benchmark for the analyze/generate path.
+
+Runs against synthetic contracts with the stub model backend, e.g.:
+
+    python benchmark.py --sizes 10 100 1000 5000 --repeat 3 --stub-latency-ms 0
+
+Each stage runs in its own subprocess. rss_peak_kb is that process's peak
+resident set size, and rss_delta_kb is how far the stage raised it above
+the RSS just before the stage. py_heap_kb is the tracemalloc peak, which covers
+Python objects only.
+"""
+import argparse
+import gc
+import io
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# The stub backend must be selected before main.py builds its provider
+os.environ.setdefault("MODEL_PROVIDER", "stub")
+# Repeated runs would otherwise measure suggestion cache hits instead of the pipeline
+os.environ.setdefault("SUGGESTION_CACHE_ENABLED", "false")
+
+import docx
+
+import main
+
+SAMPLE_CLAUSES = [
+    "This Leave and License Agreement is made and executed at [City] on [Date] between [Licensor Name] and [Licensee Name].",
+    "The Licensor hereby grants to the Licensee a license to use the premises for residential purposes only.",
+    "The Licensee shall pay a monthly compensation of Rs. [Amount] on or before the 5th day of each English calendar month.",
+    "The Licensee shall pay an interest free refundable security deposit of Rs. [Deposit] to the Licensor.",
+    "Either party may terminate this agreement by giving one month's prior notice in writing to the other party.",
+    "The Licensee shall not sub-let, assign or part with possession of the premises or any part thereof.",
+    "All disputes arising out of this agreement shall be subject to the jurisdiction of the courts at [City].",
+]
+
+def build_synthetic_contract(paragraph_count):
+    doc = docx.Document()
+    doc.add_heading("LEAVE AND LICENSE AGREEMENT", level=1)
+    for i in range(paragraph_count - 1):
+        if i % 10 == 9:
+            doc.add_paragraph("")
+        else:
+            doc.add_paragraph(f"{i + 1}. {SAMPLE_CLAUSES[i % len(SAMPLE_CLAUSES)]}")
+    stream = io.BytesIO()
+    doc.save(stream)
+    return stream.getvalue()
+
+STAGES = ["parse_docx_to_json", "parse_docx_stream", "build_prompt", "get_ai_suggestions", "generate_document"]
+FORM_DATA_TEXT = "- Licensor Name: A. Sharma\n- Licensee Name: R. Mehta\n- City: Pune"
+SCENARIO = "The licensee will keep a small pet and wants a two month notice period."
+
+def _proc_status_kb(field):
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def reset_peak_rss():
+    # Linux lets a process reset its own high-water mark (VmHWM); elsewhere the
+    # peak can only grow, so deltas are a lower bound
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def peak_rss_kb():
+    peak = _proc_status_kb("VmHWM")
+    if peak is not None:
+        return peak
+    # ru_maxrss is KiB on Linux but bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+def measure(fn, repeat):
+    # RSS includes lxml's C-level trees, which dominate python-docx memory.
+    # tracemalloc runs in a separate pass so its bookkeeping doesn't inflate RSS.
+    gc.collect()
+    if reset_peak_rss():
+        baseline_rss = _proc_status_kb("VmRSS")
+    else:
+        baseline_rss = peak_rss_kb()
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    peak_rss = peak_rss_kb()
+
+    gc.collect()
+    tracemalloc.start()
+    fn()
+    py_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {
+        "seconds": min(timings),
+        "rss_peak_kb": peak_rss,
+        "rss_delta_kb": peak_rss - baseline_rss,
+        "py_heap_kb": py_peak // 1024,
+    }
+
+def run_stage(stage, workdir, repeat):
+    # Runs in a fresh subprocess so each stage gets its own RSS high-water mark.
+    # Inputs come from files written by the parent, so setup doesn't inflate the peak.
+    with open(os.path.join(workdir, "contract.docx"), 'rb') as f:
+        data = f.read()
+    with open(os.path.join(workdir, "clauses.json")) as f:
+        clauses = json.load(f)
+    with open(os.path.join(workdir, "suggestions.json")) as f:
+        suggestions = json.load(f)
+
+    if stage == "parse_docx_to_json":
+        fn = lambda: main.parse_docx_to_json(io.BytesIO(data))
+    elif stage == "parse_docx_stream":
+        fn = lambda: main.parse_docx_stream(io.BytesIO(data))
+    elif stage == "build_prompt":
+        fn = lambda: [main.build_prompt(chunk, SCENARIO, FORM_DATA_TEXT)
+                      for chunk in main.chunk_clauses(clauses, main.app.config['AI_CHUNK_TOKENS'])]
+    elif stage == "get_ai_suggestions":
+        fn = lambda: main.get_ai_suggestions(clauses, SCENARIO, FORM_DATA_TEXT)
+    elif stage == "generate_document":
+        main.app.config['TEMPLATE_DIR'] = workdir
+        client = main.app.test_client()
+
+        def fn():
+            response = client.post('/api/generate-document', json={"fileName": "contract.docx", "suggestions": suggestions})
+            assert response.status_code == 200, response.get_data(as_text=True)
+            return response
+    else:
+        raise ValueError(f"Unknown stage '{stage}'.")
+
+    return measure(fn, repeat)
+
+def run_benchmark(sizes, repeat, stub_latency_ms):
+    rows = []
+    for size in sizes:
+        workdir = tempfile.mkdtemp(prefix="legalease-bench-")
+        try:
+            data = build_synthetic_contract(size)
+            with open(os.path.join(workdir, "contract.docx"), 'wb') as f:
+                f.write(data)
+            clauses = main.parse_docx_to_json(io.BytesIO(data))
+            with open(os.path.join(workdir, "clauses.json"), 'w') as f:
+                json.dump(clauses, f)
+            with open(os.path.join(workdir, "suggestions.json"), 'w') as f:
+                json.dump(main.get_ai_suggestions(clauses, SCENARIO, FORM_DATA_TEXT), f)
+
+            for stage in STAGES:
+                output = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--worker", stage, "--workdir", workdir,
+                     "--repeat", str(repeat), "--stub-latency-ms", str(stub_latency_ms)],
+                    check=True, capture_output=True, text=True,
+                ).stdout
+                stats = json.loads(output.strip().splitlines()[-1])
+                rows.append((size, stage, stats))
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return rows
+
+def print_report(rows):
+    print(f"{'paragraphs':>10}  {'stage':<20} {'latency_ms':>11} {'paras/s':>10} "
+          f"{'rss_peak_kb':>12} {'rss_delta_kb':>13} {'py_heap_kb':>11}")
+    for size, stage, stats in rows:
+        seconds = stats["seconds"]
+        throughput = size / seconds if seconds else float("inf")
+        print(f"{size:>10}  {stage:<20} {seconds * 1000:>11.2f} {throughput:>10.0f} "
+              f"{stats['rss_peak_kb']:>12} {stats['rss_delta_kb']:>13} {stats['py_heap_kb']:>11}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000, 5000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--stub-latency-ms", type=float, default=0)
+    parser.add_argument("--worker", choices=STAGES, help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if main.MODEL_PROVIDER == "stub":
+        main.suggestion_provider.latency = args.stub_latency_ms / 1000.0
+
+    if args.worker:
+        print(json.dumps(run_stage(args.worker, args.workdir, args.repeat)))
+    else:
+        print_report(run_benchmark(args.sizes, args.repeat, args.stub_latency_ms))
@@ -0,0 +1,126 @@
+import copy
+
+from docx.oxml import OxmlElement
+from docx.text.paragraph import Paragraph
+
+from doc_cache import normalize_text
+
+# --- Suggestion Application Engine ---
+# Resolves every suggestion against the cached paragraph index first, then
+# mutates the document in a single pass over the affected paragraphs.
+
+def _report(index, suggestion, status, matched_by=None, detail=None):
+    return {
+        "index": index,
+        "action": suggestion.get("action") if isinstance(suggestion, dict) else None,
+        "clause_id": suggestion.get("clause_id") if isinstance(suggestion, dict) else None,
+        "status": status,
+        "matched_by": matched_by,
+        "detail": detail,
+    }
+
+def _resolve(suggestion, parsed_doc, paragraphs, claimed):
+    # Returns (position, matched_by) or (None, None).
+    # The clause_id wins unless the suggestion's original_text clearly belongs elsewhere.
+    clause_id = suggestion.get("clause_id")
+    original_text = normalize_text(suggestion.get("original_text", ""))
+    # A model that paraphrases or truncates original_text still gets its clause_id honoured.
+    position = parsed_doc.clause_positions.get(clause_id)
+    if position is not None and position >= len(paragraphs):
+        position = None
+    if position is not None and (not original_text or normalize_text(paragraphs[position].text) == original_text):
+        return position, "clause_id"
+    if original_text:
+        for candidate in parsed_doc.text_positions.get(original_text, []):
+            if candidate != position and candidate not in claimed:
+                return candidate, "text"
+    if position is not None:
+        return position, "clause_id"
+    return None, None
+
+def _holds_section_break(p):
+    return p.pPr is not None and p.pPr.sectPr is not None
+
+def _insert_paragraph_after(element, text, template_p, parent):
+    # Copying <w:pPr> keeps the anchor's style and numbering without going through
+    # Paragraph.style, which resolves the style table on every access.
+    new_p = OxmlElement("w:p")
+    if template_p.pPr is not None:
+        pPr = copy.deepcopy(template_p.pPr)
+        pPr._remove_sectPr()     # a copied section break would split the section in two
+        new_p.append(pPr)
+    element.addnext(new_p)
+    Paragraph(new_p, parent).add_run(text)
+    return new_p
+
+def apply_suggestions(doc, parsed_doc, suggestions):
+    paragraphs = doc.paragraphs
+    report = [None] * len(suggestions)
+    edits = {}            # position -> (index, suggestion, matched_by) for MODIFY/REMOVE
+    additions = {}        # anchor position -> [(index, text)]
+    appended = []         # (index, text) with no resolvable anchor
+
+    for index, suggestion in enumerate(suggestions):
+        if not isinstance(suggestion, dict):
+            report[index] = _report(index, {}, "skipped", detail="Suggestion is not an object.")
+            continue
+        action = suggestion.get("action")
+        if action in ("MODIFY", "REMOVE"):
+            position, matched_by = _resolve(suggestion, parsed_doc, paragraphs, edits)
+            if position is None:
+                report[index] = _report(index, suggestion, "unmatched", detail="No paragraph matches clause_id or original_text.")
+            elif position in edits:
+                report[index] = _report(index, suggestion, "skipped", matched_by,
+                                        f"Paragraph already targeted by suggestion {edits[position][0]}.")
+            else:
+                edits[position] = (index, suggestion, matched_by)
+        elif action == "ADD":
+            new_clause = suggestion.get("new_clause") or {}
+            text = new_clause.get("text", "") if isinstance(new_clause, dict) else ""
+            if not text:
+                report[index] = _report(index, suggestion, "skipped", detail="ADD suggestion has no new_clause text.")
+                continue
+            anchor = parsed_doc.clause_positions.get(suggestion.get("clause_id"))
+            if anchor is not None and anchor < len(paragraphs):
+                additions.setdefault(anchor, []).append((index, text))
+            else:
+                appended.append((index, text))
+        else:
+            report[index] = _report(index, suggestion, "skipped", detail=f"Unsupported action '{action}'.")
+
+    # Single pass over the touched paragraphs. Insertions use the anchor's XML
+    # element, so they still land in the right place if the anchor is removed.
+    removed = []
+    removed_positions = set()
+    for position in sorted(set(edits) | set(additions)):
+        paragraph = paragraphs[position]
+        if position in edits:
+            index, suggestion, matched_by = edits[position]
+            if suggestion["action"] == "MODIFY":
+                # clear() drops the runs but keeps paragraph properties, including the style
+                paragraph.clear()
+                paragraph.add_run(suggestion.get("new_text", ""))
+            elif _holds_section_break(paragraph._p):
+                # Detaching this <w:p> would merge two sections (page setup, headers
+                # and footers live in its sectPr), so only its runs are cleared
+                paragraph.clear()
+            else:
+                removed.append(paragraph._p)
+                removed_positions.add(position)
+            report[index] = _report(index, suggestion, "applied", matched_by)
+        last_element = paragraph._p
+        for index, text in additions.get(position, []):
+            last_element = _insert_paragraph_after(last_element, text, paragraph._p, paragraph._parent)
+            report[index] = _report(index, suggestions[index], "applied", "clause_id", "Inserted after anchor clause.")
+
+    if appended:
+        body_paragraphs = [p for i, p in enumerate(paragraphs) if i not in removed_positions]
+        style = body_paragraphs[-1].style if body_paragraphs else None
+        for index, text in appended:
+            doc.add_paragraph(text, style=style)
+            report[index] = _report(index, suggestions[index], "applied", None, "Anchor not found; appended at end.")
+
+    for element in removed:
+        element.getparent().remove(element)
+
+    return report
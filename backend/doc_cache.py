@@ -0,0 +1,130 @@
+import hashlib
+import io
+import os
+import re
+import threading
+from collections import OrderedDict
+
+# --- Text Normalization ---
+_QUOTE_TRANSLATION = str.maketrans({
+    "‘": "'", "’": "'", "‚": "'", "‛": "'",
+    "“": '"', "”": '"', "„": '"', "‟": '"',
+    " ": " ",
+})
+_WHITESPACE_RE = re.compile(r"\s+")
+# Only body paragraphs (clause_XXX) map onto doc.paragraphs; table cells, headers etc. don't
+_BODY_CLAUSE_RE = re.compile(r"^clause_(\d+)$")
+
+def normalize_text(text):
+    # Collapse whitespace and curly quotes so lookups survive copy/paste and model round trips
+    return _WHITESPACE_RE.sub(" ", (text or "").translate(_QUOTE_TRANSLATION)).strip()
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+# --- Parsed Document Cache ---
+class ParsedDocument:
+    def __init__(self, digest, data, clauses, paragraph_count):
+        self.digest = digest
+        self.data = data
+        # Only body paragraphs can be edited by generate_document. Table cells, text boxes,
+        # content controls and headers/footers (DOCX_PARSER=stream) are kept apart and
+        # only shown to the model as read-only context.
+        self.clauses = [c for c in clauses if _BODY_CLAUSE_RE.match(c["clause_id"])]
+        self.context_clauses = [c for c in clauses if not _BODY_CLAUSE_RE.match(c["clause_id"])]
+        self.paragraph_count = paragraph_count
+        # clause_id -> position in doc.paragraphs, plus a normalized-text fallback
+        self.clause_positions = {}
+        self.text_positions = {}
+        for clause in self.clauses:
+            match = _BODY_CLAUSE_RE.match(clause["clause_id"])
+            position = int(match.group(1)) - 1
+            self.clause_positions[clause["clause_id"]] = position
+            self.text_positions.setdefault(normalize_text(clause["text"]), []).append(position)
+
+    @property
+    def size(self):
+        return len(self.data) + sum(len(c["text"]) for c in self.clauses + self.context_clauses)
+
+    def open_document(self):
+        # A fresh python-docx tree every time; callers mutate it, so it is never shared
+        import docx
+        return docx.Document(io.BytesIO(self.data))
+
+
+class ParsedDocCache:
+    def __init__(self, parser, max_entries=32, max_bytes=64 * 1024 * 1024):
+        self.parser = parser
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._template_keys = {}
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+
+    def get_by_bytes(self, data):
+        digest = content_hash(data)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return entry
+            self.misses += 1
+
+        # Parse outside the lock so one large upload doesn't stall every other request
+        clauses, paragraph_count = self.parser(io.BytesIO(data))
+        entry = ParsedDocument(digest, data, clauses, paragraph_count)
+        with self._lock:
+            existing = self._entries.get(digest)
+            if existing is not None:
+                return existing
+            self._entries[digest] = entry
+            self._total_bytes += entry.size
+            self._evict()
+        return entry
+
+    def get_by_template(self, path):
+        stat = os.stat(path)
+        key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            digest = self._template_keys.get(key)
+            entry = self._entries.get(digest) if digest else None
+            if entry is not None:
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return entry
+
+        with open(path, 'rb') as f:
+            data = f.read()
+        entry = self.get_by_bytes(data)
+        with self._lock:
+            # Drop keys for older mtimes of the same file
+            for old_key in [k for k in self._template_keys if k[0] == key[0]]:
+                del self._template_keys[old_key]
+            self._template_keys[key] = entry.digest
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._template_keys.clear()
+            self._total_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._total_bytes > self.max_bytes):
+            digest, entry = self._entries.popitem(last=False)
+            self._total_bytes -= entry.size
+            for key in [k for k, d in self._template_keys.items() if d == digest]:
+                del self._template_keys[key]
@@ -0,0 +1,174 @@
+import re
+import zipfile
+
+from lxml import etree
+
+# --- Streaming .docx Parser ---
+# Reads the WordprocessingML parts straight out of the zip with iterparse and
+# throws away each top-level element once it has been read, so memory stays
+# proportional to the largest single paragraph/table rather than the document.
+#
+# Body-level paragraphs keep the clause_XXX ids produced by parse_docx_to_json
+# (the position in doc.paragraphs), so both parsers agree on what the model and
+# generate_document see. Content python-docx never exposed through
+# doc.paragraphs gets ids anchored on the preceding body paragraph:
+#   clause_012-t1r2c3p1   table 1 after clause 12, row 2, cell 3, paragraph 1
+#   clause_012-x1p2       text box 1 after clause 12, paragraph 2
+#   clause_012-s1p1       content control 1 after clause 12, paragraph 1
+#   header1-p001          paragraph 1 of word/header1.xml (footers likewise)
+# generate_document can only edit body paragraphs, so the anchored clauses are
+# sent to the model as read-only context (see ParsedDocument.context_clauses).
+
+W_NS = "http://schemas.openxmlformats.org/wordprocessingml/2006/main"
+W = f"{{{W_NS}}}"
+# Text boxes are written twice (DrawingML choice + VML fallback); only read the first
+MC_FALLBACK = "{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback"
+
+_HEADER_FOOTER_RE = re.compile(r"^word/(header|footer)(\d*)\.xml$")
+
+def _local(tag):
+    return tag[len(W):] if tag.startswith(W) else None
+
+
+class _PartParser:
+    def __init__(self, stream):
+        self.stream = stream
+        self.clauses = []
+        self.body_paragraphs = 0
+        self.section = 1
+        self._tags = []
+        self._buffers = []
+        self._tables = []
+        self._table_count = 0
+        self._textbox_count = 0
+        self._textbox = None
+        self._sdt_count = 0
+        self._sdt = None
+        self._fallback_depth = 0
+
+    def parse(self, emit_paragraph):
+        for event, elem in etree.iterparse(self.stream, events=("start", "end")):
+            if elem.tag == MC_FALLBACK:
+                self._fallback_depth += 1 if event == "start" else -1
+                continue
+            tag = _local(elem.tag)
+            if self._fallback_depth:
+                continue
+            if event == "start":
+                self._start(tag)
+                self._tags.append(tag)
+                continue
+
+            self._tags.pop()
+            parent = self._tags[-1] if self._tags else None
+            if tag == "t" and parent == "r" and self._buffers:
+                self._buffers[-1].append(elem.text or "")
+            elif tag == "tab" and parent == "r" and self._buffers:
+                self._buffers[-1].append("\t")
+            elif tag in ("br", "cr") and parent == "r" and self._buffers:
+                self._buffers[-1].append("\n")
+            elif tag == "p":
+                text = "".join(self._buffers.pop()).strip()
+                emit_paragraph(self, text, parent)
+                if elem.find(f"{W}pPr/{W}sectPr") is not None:
+                    self.section += 1
+            elif tag == "tbl":
+                self._tables.pop()
+            elif tag == "txbxContent":
+                self._textbox = None
+            elif tag == "sdtContent":
+                self._sdt = None
+
+            # Drop everything already consumed below the part's container element
+            if len(self._tags) <= 2 and tag is not None:
+                elem.clear()
+                while elem.getprevious() is not None:
+                    del elem.getparent()[0]
+        return self.clauses
+
+    def _start(self, tag):
+        if tag == "p":
+            self._buffers.append([])
+        elif tag == "tbl":
+            if not self._tables:
+                self._table_count += 1
+            self._tables.append({"table": self._table_count, "row": 0, "cell": 0, "paragraph": 0})
+        elif tag == "tr" and self._tables:
+            self._tables[-1]["row"] += 1
+            self._tables[-1]["cell"] = 0
+        elif tag == "tc" and self._tables:
+            self._tables[-1]["cell"] += 1
+            self._tables[-1]["paragraph"] = 0
+        elif tag == "txbxContent":
+            self._textbox_count += 1
+            self._textbox = {"textbox": self._textbox_count, "paragraph": 0}
+        elif tag == "sdtContent" and self._sdt is None and not self._tables and self._textbox is None:
+            self._sdt_count += 1
+            self._sdt = {"sdt": self._sdt_count, "paragraph": 0}
+
+    def anchor(self):
+        return f"clause_{self.body_paragraphs:03d}"
+
+
+def _emit_body_paragraph(state, text, parent):
+    if state._textbox is not None:
+        state._textbox["paragraph"] += 1
+        clause_id = f"{state.anchor()}-x{state._textbox['textbox']}p{state._textbox['paragraph']}"
+        extra = {"part": "textbox"}
+    elif state._tables:
+        table = state._tables[-1]
+        table["paragraph"] += 1
+        clause_id = (f"{state.anchor()}-t{table['table']}r{table['row']}"
+                     f"c{table['cell']}p{table['paragraph']}")
+        extra = {"part": "table", "table": table["table"], "row": table["row"], "cell": table["cell"]}
+    elif parent == "body":
+        state.body_paragraphs += 1
+        clause_id = f"clause_{state.body_paragraphs:03d}"
+        extra = {"part": "body"}
+    elif state._sdt is not None:
+        state._sdt["paragraph"] += 1
+        clause_id = f"{state.anchor()}-s{state._sdt['sdt']}p{state._sdt['paragraph']}"
+        extra = {"part": "content_control"}
+    else:
+        return
+    if text:
+        state.clauses.append({"clause_id": clause_id, "text": text, **extra, "section": state.section})
+
+
+def _parse_header_footer(archive, name, kind, number):
+    state = _PartParser(archive.open(name))
+    part = f"{kind}{number}"
+
+    def emit(state, text, parent):
+        state.body_paragraphs += 1
+        if text:
+            state.clauses.append({
+                "clause_id": f"{part}-p{state.body_paragraphs:03d}",
+                "text": text,
+                "part": kind,
+            })
+
+    return state.parse(emit)
+
+
+def parse_docx_stream(file_stream):
+    # Returns (clauses, body_paragraph_count), the same contract as main.parse_docx
+    with zipfile.ZipFile(file_stream) as archive:
+        names = archive.namelist()
+        parts = sorted(
+            (m.group(1), int(m.group(2) or 0), name)
+            for name in names
+            for m in [_HEADER_FOOTER_RE.match(name)] if m
+        )
+        clauses = []
+        for kind, number, name in parts:
+            if kind == "header":
+                clauses.extend(_parse_header_footer(archive, name, kind, number))
+
+        body = _PartParser(archive.open("word/document.xml"))
+        clauses.extend(body.parse(_emit_body_paragraph))
+
+        for kind, number, name in parts:
+            if kind == "footer":
+                clauses.extend(_parse_header_footer(archive, name, kind, number))
+    return clauses, body.body_paragraphs
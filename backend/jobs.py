@@ -0,0 +1,210 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Job Stores ---
+# A job is a plain dict: id, kind, status (queued/running/done/failed), created_at,
+# updated_at, result (JSON-serializable), artifact (bytes or None) and error.
+class QueueFullError(Exception):
+    pass
+
+
+def _boot_id():
+    try:
+        with open("/proc/sys/kernel/random/boot_id") as f:
+            return f.read().strip()
+    except OSError:
+        return ""
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def process_owner():
+    # host|boot|pid identifies the process that queued a job, so a restart only
+    # fails its own leftovers and never jobs of other workers sharing the file
+    return f"{socket.gethostname()}|{_boot_id()}|{os.getpid()}"
+
+def owner_is_dead(owner):
+    if owner is None:
+        return True     # queued before owners were recorded, i.e. by a previous deployment
+    try:
+        host, boot_id, pid = owner.rsplit("|", 2)
+        pid = int(pid)
+    except (AttributeError, ValueError):
+        return False
+    if host != socket.gethostname():
+        return False    # can't see processes on other hosts
+    if boot_id != _boot_id() or pid == os.getpid():
+        return True     # machine rebooted, or our pid was reused from a dead process
+    return not _pid_alive(pid)
+
+
+class MemoryJobStore:
+    def __init__(self, ttl_seconds=3600):
+        self.ttl_seconds = ttl_seconds
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, kind):
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex, "kind": kind, "status": "queued",
+            "created_at": now, "updated_at": now,
+            "result": None, "artifact": None, "error": None,
+        }
+        self.purge_expired()
+        with self._lock:
+            self._jobs[job["id"]] = job
+        return dict(job)
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None:
+                job.update(fields, updated_at=time.time())
+
+    def get(self, job_id):
+        self.purge_expired()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def purge_expired(self):
+        cutoff = time.time() - self.ttl_seconds
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job["status"] in ("done", "failed") and job["updated_at"] < cutoff]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+
+class SqliteJobStore:
+    def __init__(self, path, ttl_seconds=3600):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.owner = process_owner()
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY,"
+                " kind TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " result TEXT,"
+                " artifact BLOB,"
+                " error TEXT,"
+                " owner TEXT)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "owner" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            # Jobs that were queued or running when their process died will never finish.
+            # Other live processes sharing this file keep theirs.
+            stale = conn.execute(
+                "SELECT id, owner FROM jobs WHERE status IN ('queued', 'running')"
+            ).fetchall()
+            now = time.time()
+            conn.executemany(
+                "UPDATE jobs SET status = 'failed', error = 'Server restarted before the job finished.',"
+                " updated_at = ? WHERE id = ?",
+                [(now, job_id) for job_id, owner in stale if owner_is_dead(owner)],
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def create(self, kind):
+        now = time.time()
+        job_id = uuid.uuid4().hex
+        self.purge_expired()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, status, created_at, updated_at, owner) VALUES (?, ?, 'queued', ?, ?, ?)",
+                (job_id, kind, now, now, self.owner),
+            )
+        return self.get(job_id)
+
+    def update(self, job_id, **fields):
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"])
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id):
+        self.purge_expired()
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT id, kind, status, created_at, updated_at, result, artifact, error FROM jobs WHERE id = ?",
+                (job_id,),
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(zip(("id", "kind", "status", "created_at", "updated_at", "result", "artifact", "error"), row))
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def purge_expired(self):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "DELETE FROM jobs WHERE status IN ('done', 'failed') AND updated_at < ?",
+                (time.time() - self.ttl_seconds,),
+            )
+
+
+# --- Worker Pool ---
+class JobManager:
+    def __init__(self, store, max_workers=4, max_queue=32):
+        self.store = store
+        self.capacity = max_workers + max_queue
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="legalease-job")
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    def submit(self, kind, work):
+        # work() returns (result, artifact_bytes_or_None) and runs on a pool thread
+        with self._lock:
+            if self._in_flight >= self.capacity:
+                raise QueueFullError("Too many jobs in progress. Please retry shortly.")
+            self._in_flight += 1
+        try:
+            job = self.store.create(kind)
+            self._executor.submit(self._run, job["id"], work)
+        except Exception:
+            with self._lock:
+                self._in_flight -= 1
+            raise
+        return job
+
+    def _run(self, job_id, work):
+        try:
+            self.store.update(job_id, status="running")
+            result, artifact = work()
+            self.store.update(job_id, status="done", result=result, artifact=artifact)
+        except Exception as e:
+            print(f"Error running job {job_id}: {e}")
+            self.store.update(job_id, status="failed", error=str(e))
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+
+    def stats(self):
+        with self._lock:
+            return {"in_flight": self._in_flight, "capacity": self.capacity}
@@ -1,47 +1,233 @@
 import os
-import google.generativeai as genai
-from flask import Flask, request, jsonify, send_from_directory, send_file
+from flask import (
+    Flask, Response, g, has_request_context, request, jsonify, send_from_directory, send_file, stream_with_context,
+)
 from flask_cors import CORS
 from dotenv import load_dotenv
 import docx
 import json
 import io
+import base64
+import time
+from concurrent.futures import ThreadPoolExecutor
+from werkzeug.utils import safe_join
+from doc_cache import ParsedDocCache
+from doc_apply import apply_suggestions
+from docx_stream import parse_docx_stream
+from jobs import JobManager, MemoryJobStore, QueueFullError, SqliteJobStore
+from metrics import CallbackMetric, Counter, Histogram, MetricsRegistry, timed
+from template_index import IndexedTemplate, TemplateIndex, combine_targeted_suggestions, plan_targeted_analysis
+from ai_pipeline import (
+    SuggestionStreamParser, assign_context, chunk_clauses, compact_json, estimate_tokens, merge_suggestions, run_chunks,
+    stream_chunks, suggestion_key, validate_suggestion,
+)
+from providers import create_provider
+from suggestion_cache import SuggestionCache, suggestion_cache_key
 
 # --- Environment and API Configuration ---
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# "gemini" (default) or "stub" for offline load tests and profiling
+MODEL_PROVIDER = os.getenv("MODEL_PROVIDER", "gemini")
 
-if not GEMINI_API_KEY:
-    raise ValueError("GEMINI_API_KEY not found. Please set it in the .env file.")
-
-genai.configure(api_key=GEMINI_API_KEY)
+suggestion_provider = create_provider(
+    MODEL_PROVIDER,
+    api_key=GEMINI_API_KEY,
+    stub_latency_ms=float(os.getenv("STUB_LATENCY_MS", "0")),
+)
 
 # --- Flask App Initialization ---
 app = Flask(__name__)
 TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
 app.config['TEMPLATE_DIR'] = TEMPLATE_DIR
-CORS(app, resources={r"/api/*": {"origins": "http://localhost:3000"}})
+app.config['DOC_CACHE_MAX_ENTRIES'] = int(os.getenv("DOC_CACHE_MAX_ENTRIES", "32"))
+app.config['DOC_CACHE_MAX_BYTES'] = int(os.getenv("DOC_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+# "python-docx" (default) or "stream" for the iterparse parser that also reads tables, headers and text boxes
+app.config['DOCX_PARSER'] = os.getenv("DOCX_PARSER", "python-docx")
+app.config['AI_CHUNK_TOKENS'] = int(os.getenv("AI_CHUNK_TOKENS", "6000"))
+app.config['AI_MAX_CONCURRENCY'] = int(os.getenv("AI_MAX_CONCURRENCY", "4"))
+app.config['AI_CHUNK_TIMEOUT'] = float(os.getenv("AI_CHUNK_TIMEOUT", "60"))
+app.config['SUGGESTION_CACHE_ENABLED'] = os.getenv("SUGGESTION_CACHE_ENABLED", "true").lower() == "true"
+app.config['SUGGESTION_CACHE_PATH'] = os.getenv(
+    "SUGGESTION_CACHE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'suggestions.sqlite3')
+)
+app.config['SUGGESTION_CACHE_TTL'] = int(os.getenv("SUGGESTION_CACHE_TTL", str(7 * 24 * 3600)))
+app.config['SUGGESTION_CACHE_MAX_ENTRIES'] = int(os.getenv("SUGGESTION_CACHE_MAX_ENTRIES", "5000"))
+app.config['JOB_WORKERS'] = int(os.getenv("JOB_WORKERS", "4"))
+app.config['JOB_QUEUE_DEPTH'] = int(os.getenv("JOB_QUEUE_DEPTH", "32"))
+app.config['JOB_TTL'] = int(os.getenv("JOB_TTL", "3600"))
+# "memory" (default) or "sqlite" to keep job state and artifacts in a local database
+app.config['JOB_STORE'] = os.getenv("JOB_STORE", "memory")
+app.config['JOB_STORE_PATH'] = os.getenv(
+    "JOB_STORE_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache', 'jobs.sqlite3')
+)
+# For templates larger than one AI_CHUNK_TOKENS chunk: fill placeholders locally and send the
+# model only clauses matching the form data plus the AI_TOP_K most relevant to the scenario
+app.config['TARGETED_PROMPTING'] = os.getenv("TARGETED_PROMPTING", "false").lower() == "true"
+app.config['AI_TOP_K'] = int(os.getenv("AI_TOP_K", "12"))
+app.config['SERVER_TIMING_ENABLED'] = os.getenv("SERVER_TIMING_ENABLED", "true").lower() == "true"
+CORS(
+    app,
+    resources={r"/api/*": {"origins": "http://localhost:3000"}},
+    expose_headers=["X-Suggestions-Applied", "X-Suggestions-Unmatched", "Server-Timing"],
+)
+
+# --- Metrics ---
+metrics_registry = MetricsRegistry()
+STAGE_SECONDS = metrics_registry.register(Histogram(
+    "legalease_stage_duration_seconds", "Time spent in each processing stage.", ["stage"],
+))
+MODEL_BYTES = metrics_registry.register(Counter(
+    "legalease_model_bytes_total", "UTF-8 bytes sent to and received from the model.", ["direction"],
+))
+MODEL_TOKENS = metrics_registry.register(Counter(
+    "legalease_model_tokens_total", "Estimated tokens sent to and received from the model.", ["direction"],
+))
+PROMPT_TOKENS = metrics_registry.register(Histogram(
+    "legalease_prompt_tokens", "Estimated tokens per prompt.", [],
+    buckets=(256, 512, 1024, 2048, 4096, 8192, 16384, 32768),
+))
+ERRORS = metrics_registry.register(Counter(
+    "legalease_errors_total", "Errors by stage.", ["stage"],
+))
+REQUESTS = metrics_registry.register(Counter(
+    "legalease_http_requests_total", "HTTP requests by endpoint and status code.", ["endpoint", "status"],
+))
+
+def record_server_timing(name):
+    def record(seconds):
+        if has_request_context():
+            timings = g.setdefault('server_timing', {})
+            timings[name] = timings.get(name, 0.0) + seconds
+    return record
+
+def stage(name):
+    # Histogram span that also shows up in the response's Server-Timing header
+    # when it runs on the request thread (chunk and job workers only feed the histogram).
+    return timed(STAGE_SECONDS, on_done=record_server_timing(name), stage=name)
+
+def record_model_io(direction, text):
+    tokens = estimate_tokens(text)
+    MODEL_BYTES.inc(len(text.encode("utf-8")), direction=direction)
+    MODEL_TOKENS.inc(tokens, direction=direction)
+    if direction == "prompt":
+        PROMPT_TOKENS.observe(tokens)
+
+@app.after_request
+def add_request_metrics(response):
+    REQUESTS.inc(endpoint=request.endpoint or "unknown", status=str(response.status_code))
+    timings = g.get('server_timing')
+    if timings and app.config['SERVER_TIMING_ENABLED']:
+        response.headers['Server-Timing'] = ", ".join(
+            f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()
+        )
+    return response
 
 # --- Helper Functions ---
-def parse_docx_to_json(file_stream):
+def parse_docx(file_stream):
     doc = docx.Document(file_stream)
+    paragraphs = doc.paragraphs
     clauses = []
-    for i, para in enumerate(doc.paragraphs):
+    for i, para in enumerate(paragraphs):
         if para.text.strip():
             clauses.append({"clause_id": f"clause_{i+1:03d}", "text": para.text.strip()})
+    return clauses, len(paragraphs)
+
+def parse_docx_to_json(file_stream):
+    clauses, _ = parse_docx(file_stream)
     return clauses
 
+DOCX_PARSERS = {
+    "python-docx": parse_docx,
+    "stream": parse_docx_stream,
+}
+
+if app.config['DOCX_PARSER'] not in DOCX_PARSERS:
+    raise ValueError(f"Unknown DOCX_PARSER '{app.config['DOCX_PARSER']}'. Expected one of: {', '.join(DOCX_PARSERS)}.")
+
+def timed_docx_parser(file_stream):
+    with stage("docx_parse"):
+        return DOCX_PARSERS[app.config['DOCX_PARSER']](file_stream)
+
+# Parsed templates keyed by content hash (and by filename + mtime for files in TEMPLATE_DIR)
+doc_cache = ParsedDocCache(
+    timed_docx_parser,
+    max_entries=app.config['DOC_CACHE_MAX_ENTRIES'],
+    max_bytes=app.config['DOC_CACHE_MAX_BYTES'],
+)
+
+# One pool for every model call, so concurrency is capped at AI_MAX_CONCURRENCY
+# across all requests and background jobs rather than per request
+model_executor = ThreadPoolExecutor(
+    max_workers=max(1, app.config['AI_MAX_CONCURRENCY']), thread_name_prefix="legalease-model"
+)
+
+# Persistent cache of AI suggestions keyed on (clauses, scenario, form data)
+suggestion_cache = None
+if app.config['SUGGESTION_CACHE_ENABLED']:
+    suggestion_cache = SuggestionCache(
+        app.config['SUGGESTION_CACHE_PATH'],
+        ttl_seconds=app.config['SUGGESTION_CACHE_TTL'],
+        max_entries=app.config['SUGGESTION_CACHE_MAX_ENTRIES'],
+    )
+
+# Background worker pool for ?async=true requests
+if app.config['JOB_STORE'] == "sqlite":
+    job_store = SqliteJobStore(app.config['JOB_STORE_PATH'], ttl_seconds=app.config['JOB_TTL'])
+else:
+    job_store = MemoryJobStore(ttl_seconds=app.config['JOB_TTL'])
+job_manager = JobManager(job_store, max_workers=app.config['JOB_WORKERS'], max_queue=app.config['JOB_QUEUE_DEPTH'])
+
+def collect_cache_stats():
+    values = {}
+    caches = [("document", doc_cache)] + ([("suggestion", suggestion_cache)] if suggestion_cache else [])
+    for name, cache in caches:
+        stats = cache.stats()
+        values[(name, "hit")] = stats["hits"]
+        values[(name, "miss")] = stats["misses"]
+    return values
+
+metrics_registry.register(CallbackMetric(
+    "legalease_cache_requests_total", "Cache lookups by cache and result.", ["cache", "result"],
+    collect_cache_stats, type_name="counter",
+))
+metrics_registry.register(CallbackMetric(
+    "legalease_jobs_in_flight", "Queued plus running background jobs.", [],
+    lambda: {(): job_manager.stats()["in_flight"]},
+))
+
+# Placeholder map and TF-IDF clause vectors for every template, refreshed by mtime
+template_index = TemplateIndex(app.config['TEMPLATE_DIR'], doc_cache)
+with stage("template_index"):
+    template_index.refresh()
+
+def resolve_template_path(file_name):
+    if not file_name:
+        return None
+    path = safe_join(app.config['TEMPLATE_DIR'], file_name)
+    if path is None or not os.path.isfile(path):
+        return None
+    return path
+
 # --- AI Interaction Logic ---
-def get_ai_suggestions(document_json, scenario_text, form_data_text):
-    model = genai.GenerativeModel('gemini-1.5-flash-latest')
-    prompt = f"""
+def build_prompt(document_json, scenario_text, form_data_text, context_clauses=None):
+    reference_section = ""
+    if context_clauses:
+        reference_section = f"""
+    **Reference Only (tables, text boxes, headers and footers; JSON):**
+    These cannot be edited. Use them to understand the document, but never use their IDs as a clause_id.
+    ---
+    {compact_json(context_clauses)}
+    ---
+"""
+    return f"""
     You are a meticulous legal AI assistant. Your task is to analyze a user's scenario against a legal document,
     incorporate pre-filled data, and suggest specific modifications.
 
     **Instructions:**
     1.  First, review the `base_details` which contain the foundational information for the agreement.
     2.  Next, carefully review the `scenario` which describes the specific, custom changes required.
-    3.  Analyze each `clause` from the `document_clauses`.
+    3.  Analyze each `clause` from the `document_clauses`. These may be only one section of a longer document; suggest changes only for the clauses shown.
     4.  Suggest modifications ("MODIFY", "ADD", "REMOVE") based on the `scenario`.
     5.  When generating `new_text` for "MODIFY" or "ADD" actions, you **MUST** replace the placeholders with the corresponding values from the `base_details`. Do not leave placeholders like [Client Name] in your final suggested text.
     6.  Your response **MUST** be a single, valid JSON object with one key: "suggestions".
@@ -65,19 +251,202 @@ def get_ai_suggestions(document_json, scenario_text, form_data_text):
 
     **Document Clauses (JSON):**
     ---
-    {json.dumps(document_json, indent=2)}
+    {compact_json(document_json)}
     ---
-
+{reference_section}
     **Your JSON Response:**
     """
+
+def parse_ai_response(response_text):
+    with stage("response_parse"):
+        return _parse_ai_response(response_text)
+
+def _parse_ai_response(response_text):
+    cleaned_response_text = response_text.strip().replace("```json", "").replace("```", "")
+    suggestions = json.loads(cleaned_response_text)
+    return suggestions.get("suggestions", [])
+
+def analysis_cache_key(document_json, scenario_text, form_data_text, template, context_clauses=None):
+    variant = suggestion_provider.name
+    if template is not None:
+        variant += f"|top{app.config['AI_TOP_K']}"
+    # Read-only context is part of the prompt, so it is part of the key
+    return suggestion_cache_key(document_json + (context_clauses or []), scenario_text, form_data_text, variant)
+
+def read_only_problem(suggestion, read_only_ids):
+    if suggestion.get("clause_id") in read_only_ids:
+        return f"Clause '{suggestion['clause_id']}' is read-only context and can't be changed."
+    return None
+
+def get_ai_suggestions(document_json, scenario_text, form_data_text, bypass_cache=False, form_data=None, template=None,
+                       context_clauses=None):
+    # With a template index entry, placeholders are filled locally and only the
+    # top-k clauses relevant to the scenario go to the model. context_clauses are
+    # shown to the model but never targeted by suggestions.
+    cache_key = None
+    if suggestion_cache is not None:
+        cache_key = analysis_cache_key(document_json, scenario_text, form_data_text, template, context_clauses)
+        if not bypass_cache:
+            try:
+                cached_suggestions = suggestion_cache.get(cache_key)
+            except Exception as e:
+                print(f"Error reading suggestion cache: {e}")
+                cached_suggestions = None
+            if cached_suggestions is not None:
+                return cached_suggestions
+
+    if template is not None:
+        with stage("targeting"):
+            model_clauses, local_suggestions, original_texts = plan_targeted_analysis(
+                template, scenario_text, form_data, app.config['AI_TOP_K']
+            )
+        suggestions, complete = _run_ai_analysis(model_clauses, scenario_text, form_data_text, context_clauses)
+        if suggestions and suggestions[0].get("action") == "ERROR":
+            # Placeholder fills don't depend on the model; keep them, as the stream does
+            suggestions = suggestions + local_suggestions
+        else:
+            suggestions = merge_suggestions(
+                [combine_targeted_suggestions(suggestions, local_suggestions, original_texts)], document_json
+            )
+    else:
+        suggestions, complete = _run_ai_analysis(document_json, scenario_text, form_data_text, context_clauses)
+
+    # Only complete, error-free analyses are cached; partial results are retried next time
+    if cache_key is not None and complete:
+        try:
+            suggestion_cache.put(cache_key, suggestions)
+        except Exception as e:
+            print(f"Error writing suggestion cache: {e}")
+    return suggestions
+
+def _run_ai_analysis(document_json, scenario_text, form_data_text, context_clauses=None):
+    chunk_timeout = app.config['AI_CHUNK_TIMEOUT']
+
+    def analyze_chunk(work):
+        chunk, context = work
+        with stage("prompt_build"):
+            prompt = build_prompt(chunk, scenario_text, form_data_text, context)
+        record_model_io("prompt", prompt)
+        with stage("model_call"):
+            response_text = suggestion_provider.generate(prompt, timeout=chunk_timeout)
+        record_model_io("response", response_text)
+        return parse_ai_response(response_text)
+
+    # Long agreements are split into token-budgeted chunks that share the same
+    # form data / scenario header and are analyzed concurrently.
+    chunks = chunk_clauses(document_json, app.config['AI_CHUNK_TOKENS']) or [[]]
+    work = list(zip(chunks, assign_context(chunks, context_clauses)))
     try:
-        response = model.generate_content(prompt)
-        cleaned_response_text = response.text.strip().replace("```json", "").replace("```", "")
-        suggestions = json.loads(cleaned_response_text)
-        return suggestions.get("suggestions", [])
+        # Wall-clock time of the whole fan-out, measured on the request thread
+        with stage("ai_analysis"):
+            results, errors = run_chunks(analyze_chunk, work, model_executor, chunk_timeout)
     except Exception as e:
         print(f"Error during AI call or JSON parsing: {e}")
-        return [{"action": "ERROR", "reason": str(e)}]
+        ERRORS.inc(stage="ai_analysis")
+        return [{"action": "ERROR", "reason": str(e)}], False
+
+    for index, error in errors:
+        ERRORS.inc(stage="model_chunk")
+        print(f"Error during AI call or JSON parsing (chunk {index + 1}/{len(chunks)}): {error}")
+    if len(errors) == len(chunks):
+        return [{"action": "ERROR", "reason": str(errors[0][1])}], False
+
+    read_only_ids = {clause["clause_id"] for clause in context_clauses or []}
+    results = [
+        [s for s in suggestions or [] if not (isinstance(s, dict) and read_only_problem(s, read_only_ids))]
+        for suggestions in results
+    ]
+
+    # One failed chunk only costs the suggestions for its own clauses
+    return merge_suggestions(results, document_json), not errors
+
+def stream_ai_suggestions(document_json, scenario_text, form_data_text, bypass_cache=False, form_data=None,
+                          template=None, context_clauses=None):
+    # Yields ("suggestion", dict), ("replace", {"clause_id", "suggestion"}), ("invalid", {...}),
+    # ("error", {...}) and ("cached", None) as each chunk's streamed output is parsed.
+    cache_key = None
+    if suggestion_cache is not None:
+        cache_key = analysis_cache_key(document_json, scenario_text, form_data_text, template, context_clauses)
+        if not bypass_cache:
+            try:
+                cached_suggestions = suggestion_cache.get(cache_key)
+            except Exception as e:
+                print(f"Error reading suggestion cache: {e}")
+                cached_suggestions = None
+            if cached_suggestions is not None:
+                yield "cached", None
+                for suggestion in cached_suggestions:
+                    yield "suggestion", suggestion
+                return
+
+    chunk_timeout = app.config['AI_CHUNK_TIMEOUT']
+
+    def stream_chunk(work, emit):
+        chunk, context = work
+        parser = SuggestionStreamParser()
+        with stage("prompt_build"):
+            prompt = build_prompt(chunk, scenario_text, form_data_text, context)
+        record_model_io("prompt", prompt)
+        with stage("model_stream"):
+            for fragment in suggestion_provider.generate_stream(prompt, timeout=chunk_timeout):
+                for suggestion in parser.feed(fragment):
+                    emit(suggestion)
+        record_model_io("response", parser.text)
+        if parser.emitted == 0:
+            # Nothing came out incrementally; surface malformed JSON as a chunk error
+            parse_ai_response(parser.text)
+
+    model_clauses, local_suggestions, original_texts = document_json, [], {}
+    if template is not None:
+        with stage("targeting"):
+            model_clauses, local_suggestions, original_texts = plan_targeted_analysis(
+                template, scenario_text, form_data, app.config['AI_TOP_K']
+            )
+
+    # Local placeholder fills are ready before any model call, so they go first; if the
+    # model then rewrites one of those clauses, its version replaces the fill in place
+    pending_fills = {}
+    for suggestion in local_suggestions:
+        pending_fills[suggestion["clause_id"]] = suggestion
+        yield "suggestion", suggestion
+
+    chunks = chunk_clauses(model_clauses, app.config['AI_CHUNK_TOKENS']) or [[]]
+    work = list(zip(chunks, assign_context(chunks, context_clauses)))
+    read_only_ids = {clause["clause_id"] for clause in context_clauses or []}
+    produced = []
+    seen = set()
+    failed = 0
+    for kind, index, payload in stream_chunks(stream_chunk, work, model_executor, chunk_timeout):
+        if kind == "item":
+            problem = validate_suggestion(payload) or read_only_problem(payload, read_only_ids)
+            if problem:
+                yield "invalid", {"reason": problem, "suggestion": payload}
+                continue
+            key = suggestion_key(payload)
+            if key in seen:
+                continue
+            seen.add(key)
+            if original_texts:
+                combine_targeted_suggestions([payload], [], original_texts)
+            produced.append(payload)
+            clause_id = payload.get("clause_id")
+            if clause_id in pending_fills and payload.get("action") in ("MODIFY", "REMOVE"):
+                del pending_fills[clause_id]
+                yield "replace", {"clause_id": clause_id, "suggestion": payload}
+            else:
+                yield "suggestion", payload
+        elif kind == "error":
+            failed += 1
+            ERRORS.inc(stage="model_chunk")
+            print(f"Error during AI call or JSON parsing (chunk {index + 1}/{len(chunks)}): {payload}")
+            yield "error", {"chunk": index + 1, "reason": str(payload)}
+
+    produced = list(pending_fills.values()) + produced
+    if cache_key is not None and not failed:
+        try:
+            suggestion_cache.put(cache_key, merge_suggestions([produced], document_json))
+        except Exception as e:
+            print(f"Error writing suggestion cache: {e}")
 
 # --- API Endpoints ---
 @app.route('/api/templates', methods=['GET'])
@@ -95,39 +464,175 @@ def get_template(filename):
     except FileNotFoundError:
         return jsonify({"error": "File not found."}), 404
 
-@app.route('/api/analyze', methods=['POST'])
-def analyze_document():
-    if 'document' not in request.files:
-        return jsonify({"error": "No document file provided"}), 400
+def read_analyze_request():
+    # Shared by the JSON and streaming analyze endpoints.
+    # Returns (params, None) on success or (None, error_response).
+    template_name = request.form.get('templateName')
+    if 'document' not in request.files and not template_name:
+        return None, (jsonify({"error": "No document file provided"}), 400)
 
-    file = request.files['document']
     scenario = request.form.get('scenario', '')
     form_data_json = request.form.get('formData', '{}')
+    bypass_cache = request.form.get('bypassCache', 'false').lower() == 'true'
     
     try:
         form_data = json.loads(form_data_json)
         form_data_text = "\n".join([f"- {key.replace('_', ' ').title()}: {value}" for key, value in form_data.items()])
     except json.JSONDecodeError:
-        return jsonify({"error": "Invalid form data format."}), 400
+        return None, (jsonify({"error": "Invalid form data format."}), 400)
 
     if not scenario:
-        return jsonify({"error": "No scenario text provided"}), 400
+        return None, (jsonify({"error": "No scenario text provided"}), 400)
+
+    template_path = None
+    if 'document' not in request.files:
+        template_path = resolve_template_path(template_name)
+        if not template_path:
+            return None, (jsonify({"error": "Template file not found on server"}), 404)
+
+    return {
+        "template_path": template_path,
+        "upload": read_upload() if not template_path else None,
+        "scenario": scenario,
+        "form_data": form_data,
+        "form_data_text": form_data_text,
+        "bypass_cache": bypass_cache,
+    }, None
+
+def read_upload():
+    with stage("upload_read"):
+        return request.files['document'].stream.read()
+
+def load_parsed_doc(params):
+    if params["template_path"]:
+        return doc_cache.get_by_template(params["template_path"])
+    return doc_cache.get_by_bytes(params["upload"])
+
+def load_index_entry(params, cached_doc):
+    if not app.config['TARGETED_PROMPTING']:
+        return None
+    # A template that fits in one chunk costs a single model call anyway; narrowing it
+    # would only risk dropping clauses the scenario needs changed
+    if estimate_tokens(compact_json(cached_doc.clauses)) <= app.config['AI_CHUNK_TOKENS']:
+        return None
+    if params["template_path"]:
+        return template_index.get(os.path.relpath(params["template_path"], app.config['TEMPLATE_DIR']))
+    # Uploads of a known template reuse its index; anything else is indexed on the fly
+    return template_index.find_by_digest(cached_doc.digest) or IndexedTemplate(
+        None, cached_doc.digest, None, cached_doc.clauses
+    )
+
+def run_analysis(params):
+    cached_doc = load_parsed_doc(params)
+    parsed_doc = cached_doc.clauses
+    ai_suggestions = get_ai_suggestions(
+        parsed_doc, params["scenario"], params["form_data_text"], bypass_cache=params["bypass_cache"],
+        form_data=params["form_data"], template=load_index_entry(params, cached_doc),
+        context_clauses=cached_doc.context_clauses,
+    )
+    return {
+        "originalDoc": parsed_doc,
+        "suggestions": ai_suggestions
+    }
+
+def wants_job():
+    return request.args.get('async', 'false').lower() == 'true'
+
+def wants_report():
+    return request.args.get('report', 'false').lower() == 'true'
+
+def submit_job(kind, work):
+    def counted_work():
+        try:
+            return work()
+        except Exception:
+            ERRORS.inc(stage=f"{kind}_job")
+            raise
 
     try:
-        # Use io.BytesIO to allow the stream to be read multiple times
-        file_stream = io.BytesIO(file.stream.read())
-        parsed_doc = parse_docx_to_json(file_stream)
-        ai_suggestions = get_ai_suggestions(parsed_doc, scenario, form_data_text)
+        job = job_manager.submit(kind, counted_work)
+    except QueueFullError as e:
+        response = jsonify({"error": str(e)})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    response = jsonify({"jobId": job["id"], "status": job["status"]})
+    response.headers['Location'] = f"/api/jobs/{job['id']}"
+    return response, 202
 
-        return jsonify({
-            "originalDoc": parsed_doc,
-            "suggestions": ai_suggestions
-        })
+@app.route('/api/analyze', methods=['POST'])
+def analyze_document():
+    params, error_response = read_analyze_request()
+    if error_response:
+        return error_response
+
+    if wants_job():
+        return submit_job("analyze", lambda: (run_analysis(params), None))
+
+    try:
+        return jsonify(run_analysis(params))
 
     except Exception as e:
         print(f"An error occurred: {e}")
+        ERRORS.inc(stage="analyze")
         return jsonify({"error": "Failed to process the document."}), 500
 
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.route('/api/analyze/stream', methods=['POST'])
+def analyze_document_stream():
+    # Server-sent events: originalDoc first, then one "suggestion" event per
+    # validated suggestion as the model produces it, then a "summary". A "replace"
+    # event swaps an earlier locally filled suggestion for the model's version.
+    params, error_response = read_analyze_request()
+    if error_response:
+        return error_response
+
+    def generate_events():
+        started = time.perf_counter()
+        try:
+            cached_doc = load_parsed_doc(params)
+            parsed_doc = cached_doc.clauses
+            template = load_index_entry(params, cached_doc)
+        except Exception as e:
+            print(f"An error occurred: {e}")
+            ERRORS.inc(stage="analyze")
+            yield sse_event("error", {"error": "Failed to process the document."})
+            return
+        parsed_at = time.perf_counter()
+        yield sse_event("originalDoc", parsed_doc)
+
+        summary = {"suggestions": 0, "invalid": 0, "chunkErrors": 0, "cached": False, "firstSuggestionMs": None}
+        for kind, payload in stream_ai_suggestions(
+            parsed_doc, params["scenario"], params["form_data_text"], bypass_cache=params["bypass_cache"],
+            form_data=params["form_data"], template=template, context_clauses=cached_doc.context_clauses,
+        ):
+            if kind == "suggestion":
+                if summary["firstSuggestionMs"] is None:
+                    summary["firstSuggestionMs"] = round((time.perf_counter() - started) * 1000, 1)
+                summary["suggestions"] += 1
+                yield sse_event("suggestion", payload)
+            elif kind == "replace":
+                yield sse_event("replace", payload)
+            elif kind == "invalid":
+                summary["invalid"] += 1
+                yield sse_event("invalid", payload)
+            elif kind == "error":
+                summary["chunkErrors"] += 1
+                yield sse_event("error", payload)
+            elif kind == "cached":
+                summary["cached"] = True
+
+        summary["parseMs"] = round((parsed_at - started) * 1000, 1)
+        summary["totalMs"] = round((time.perf_counter() - started) * 1000, 1)
+        yield sse_event("summary", summary)
+
+    return Response(
+        stream_with_context(generate_events()),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 # --- NEWLY ADDED CODE ---
 # --- NEWLY REVISED generate_document FUNCTION ---
 @app.route('/api/generate-document', methods=['POST'])
@@ -146,71 +651,108 @@ def generate_document():
     if not file_name:
         return jsonify({"error": "Missing fileName"}), 400
 
+    template_path = resolve_template_path(file_name)
+    if not template_path:
+        return jsonify({"error": "Template file not found on server"}), 404
+
+    if wants_job():
+        def work():
+            content, report = build_generated_document(file_name, template_path, suggestions)
+            return {"fileName": f"Generated_{file_name}", "report": report}, content
+        return submit_job("generate", work)
+
     try:
-        template_path = os.path.join(app.config['TEMPLATE_DIR'], file_name)
-        if not os.path.exists(template_path):
-            return jsonify({"error": "Template file not found on server"}), 404
-
-        # Load the original document as our template to preserve all formatting
-        doc = docx.Document(template_path)
-        
-        # We need a robust way to find paragraphs to modify.
-        # Let's map original text to the paragraph object.
-        original_text_map = {p.text.strip(): p for p in doc.paragraphs if p.text.strip()}
-
-        # A list to hold new clauses
-        added_clauses_to_append = []
-
-        # 1. Apply AI's suggestions (MODIFY, REMOVE, ADD)
-        for suggestion in suggestions:
-            action = suggestion.get('action')
-            original_text_from_suggestion = suggestion.get('original_text', '').strip()
-            new_text_from_suggestion = suggestion.get('new_text', '')
-
-            # Find the paragraph using the original text as the key
-            if action in ['MODIFY', 'REMOVE'] and original_text_from_suggestion in original_text_map:
-                paragraph_to_act_on = original_text_map[original_text_from_suggestion]
-
-                if action == 'MODIFY':
-                    # Preserve original paragraph style
-                    paragraph_style = paragraph_to_act_on.style
-                    paragraph_to_act_on.clear()
-                    paragraph_to_act_on.add_run(new_text_from_suggestion)
-                    paragraph_to_act_on.style = paragraph_style
-
-                elif action == 'REMOVE':
-                    # To "remove" a paragraph, we simply clear its content
-                    paragraph_to_act_on.clear()
-            
-            elif action == 'ADD' and 'new_clause' in suggestion:
-                # Store new clauses to be appended later
-                added_clauses_to_append.append(suggestion['new_clause'].get('text', ''))
-
-        # 2. Add any new clauses to the end of the document
-        for new_clause_text in added_clauses_to_append:
-            if new_clause_text:
-                new_paragraph = doc.add_paragraph(new_clause_text)
-                # Apply a consistent style to new paragraphs
-                if doc.paragraphs and len(doc.paragraphs) > 1:
-                    new_paragraph.style = doc.paragraphs[-2].style
-
-        # 3. Save the modified document to an in-memory stream
-        file_stream = io.BytesIO()
-        doc.save(file_stream)
-        file_stream.seek(0)
-
-        # 4. Send the stream back as a file download
-        return send_file(
-            file_stream,
-            as_attachment=True,
-            download_name=f"Generated_{file_name}",
-            mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
-        )
+        content, report = build_generated_document(file_name, template_path, suggestions)
+        if wants_report():
+            return jsonify(generated_document_body(f"Generated_{file_name}", content, report))
+        return send_generated_document(f"Generated_{file_name}", content, report)
 
     except Exception as e:
         print(f"Error generating document: {e}")
+        ERRORS.inc(stage="generate")
         return jsonify({"error": "Failed to generate the document on the server."}), 500
 
+def build_generated_document(file_name, template_path, suggestions):
+    # Load the original document as our template to preserve all formatting.
+    # Suggestions are matched by clause_id (falling back to normalized text)
+    # through the cached paragraph index and applied in a single pass.
+    cached_doc = doc_cache.get_by_template(template_path)
+    with stage("docx_open"):
+        doc = cached_doc.open_document()
+    with stage("document_mutation"):
+        report = apply_suggestions(doc, cached_doc, suggestions)
+    unmatched = [entry for entry in report if entry["status"] != "applied"]
+    if unmatched:
+        print(f"Suggestions not applied to {file_name}: {compact_json(unmatched)}")
+
+    # Save the modified document to an in-memory stream
+    file_stream = io.BytesIO()
+    with stage("docx_save"):
+        doc.save(file_stream)
+    return file_stream.getvalue(), report
+
+def generated_document_body(download_name, content, report):
+    # ?report=true: the per-suggestion report can be tens of KB for long contracts,
+    # too large for a header, so it goes in a JSON body next to the base64 document
+    return {
+        "fileName": download_name,
+        "report": report,
+        "document": base64.b64encode(content).decode("ascii"),
+    }
+
+def send_generated_document(download_name, content, report):
+    # Send the document back as a file download; only the counts go in headers.
+    # The full report is available via ?report=true or the job result.
+    unmatched = sum(1 for entry in report if entry["status"] != "applied")
+    response = send_file(
+        io.BytesIO(content),
+        as_attachment=True,
+        download_name=download_name,
+        mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+    )
+    response.headers['X-Suggestions-Applied'] = str(len(report) - unmatched)
+    response.headers['X-Suggestions-Unmatched'] = str(unmatched)
+    return response
+
+# --- Metrics Endpoint ---
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+# --- Job Endpoints ---
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found or expired."}), 404
+    body = {
+        "jobId": job["id"],
+        "kind": job["kind"],
+        "status": job["status"],
+        "createdAt": job["created_at"],
+        "updatedAt": job["updated_at"],
+    }
+    if job["status"] == "done":
+        body["result"] = job["result"]
+        if job["artifact"] is not None:
+            body["downloadUrl"] = f"/api/jobs/{job['id']}/result"
+    elif job["status"] == "failed":
+        body["error"] = job["error"]
+    return jsonify(body)
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    job = job_store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found or expired."}), 404
+    if job["status"] != "done":
+        return jsonify({"error": f"Job is {job['status']}."}), 409
+    if job["artifact"] is None:
+        return jsonify(job["result"])
+    if wants_report():
+        return jsonify(generated_document_body(job["result"]["fileName"], job["artifact"], job["result"]["report"]))
+    return send_generated_document(job["result"]["fileName"], job["artifact"], job["result"]["report"])
+
 
 # --- Run the App ---
 if __name__ == '__main__':
@@ -0,0 +1,93 @@
+import hashlib
+import json
+import re
+import time
+
+# --- Suggestion Providers ---
+# A provider turns a fully built prompt into the model's raw text response.
+# Prompt building and JSON parsing stay in main.py so every backend is
+# exercised through the same code path.
+class SuggestionProvider:
+    name = "base"
+
+    def generate(self, prompt, timeout=None):
+        raise NotImplementedError
+
+    def generate_stream(self, prompt, timeout=None):
+        # Backends without native streaming yield the whole response at once
+        yield self.generate(prompt, timeout=timeout)
+
+
+class GeminiProvider(SuggestionProvider):
+    name = "gemini"
+
+    def __init__(self, api_key, model_name='gemini-1.5-flash-latest'):
+        if not api_key:
+            raise ValueError("GEMINI_API_KEY not found. Please set it in the .env file.")
+        # Imported lazily so the stub backend works without the SDK installed
+        import google.generativeai as genai
+        genai.configure(api_key=api_key)
+        self.model = genai.GenerativeModel(model_name)
+
+    def generate(self, prompt, timeout=None):
+        request_options = {"timeout": timeout} if timeout else None
+        response = self.model.generate_content(prompt, request_options=request_options)
+        return response.text
+
+    def generate_stream(self, prompt, timeout=None):
+        request_options = {"timeout": timeout} if timeout else None
+        for chunk in self.model.generate_content(prompt, stream=True, request_options=request_options):
+            if chunk.text:
+                yield chunk.text
+
+
+_STUB_CLAUSE_RE = re.compile(r'\{"clause_id":"(clause_\d+)","text":"((?:[^"\\]|\\.)*)"')
+
+class StubProvider(SuggestionProvider):
+    # Offline backend for load tests and profiling: sleeps for a fixed latency
+    # and returns the same suggestions for the same prompt every time.
+    name = "stub"
+
+    def __init__(self, latency_ms=0, every_n=5):
+        self.latency = latency_ms / 1000.0
+        self.every_n = max(1, every_n)
+
+    def _sleep(self, seconds, timeout):
+        if seconds:
+            time.sleep(seconds if timeout is None else min(seconds, timeout))
+
+    def generate(self, prompt, timeout=None):
+        self._sleep(self.latency, timeout)
+        return self._render(prompt)
+
+    def generate_stream(self, prompt, timeout=None, pieces=8):
+        # Spread the configured latency across fixed-size pieces of the response
+        text = self._render(prompt)
+        piece_size = max(1, -(-len(text) // pieces))
+        for start in range(0, len(text), piece_size):
+            self._sleep(self.latency / pieces, timeout)
+            yield text[start:start + piece_size]
+
+    def _render(self, prompt):
+        suggestions = []
+        for clause_id, raw_text in _STUB_CLAUSE_RE.findall(prompt):
+            text = json.loads(f'"{raw_text}"')
+            bucket = int(hashlib.md5(clause_id.encode()).hexdigest(), 16) % self.every_n
+            if bucket != 0:
+                continue
+            suggestions.append({
+                "action": "MODIFY",
+                "clause_id": clause_id,
+                "original_text": text,
+                "new_text": f"{text} (as amended)",
+                "reason": "Deterministic stub suggestion.",
+            })
+        return json.dumps({"suggestions": suggestions})
+
+
+def create_provider(name, api_key=None, stub_latency_ms=0):
+    if name == "gemini":
+        return GeminiProvider(api_key)
+    if name == "stub":
+        return StubProvider(latency_ms=stub_latency_ms)
+    raise ValueError(f"Unknown MODEL_PROVIDER '{name}'. Expected 'gemini' or 'stub'.")
@@ -0,0 +1,91 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from doc_cache import normalize_text
+
+# --- Suggestion Cache ---
+def suggestion_cache_key(clauses, scenario_text, form_data_text, provider_name=""):
+    # Whitespace and quote style differences shouldn't miss the cache. Case is kept:
+    # names and addresses flow verbatim into new_text, so "JOHN SMITH" must not
+    # reuse suggestions generated for "John Smith".
+    payload = json.dumps({
+        "provider": provider_name,
+        "clauses": [[c.get("clause_id"), normalize_text(c.get("text"))] for c in clauses],
+        "scenario": normalize_text(scenario_text),
+        "form_data": normalize_text(form_data_text),
+    }, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def is_cacheable(suggestions):
+    return isinstance(suggestions, list) and not any(
+        isinstance(s, dict) and s.get("action") == "ERROR" for s in suggestions
+    )
+
+
+class SuggestionCache:
+    def __init__(self, path, ttl_seconds=7 * 24 * 3600, max_entries=5000):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS suggestions ("
+                " key TEXT PRIMARY KEY,"
+                " suggestions TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_access REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_suggestions_last_access ON suggestions (last_access)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT suggestions FROM suggestions WHERE key = ? AND created_at > ?",
+                (key, now - self.ttl_seconds),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            conn.execute("UPDATE suggestions SET last_access = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key, suggestions):
+        if not is_cacheable(suggestions):
+            return False
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO suggestions (key, suggestions, created_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(suggestions, separators=(",", ":")), now, now),
+            )
+            conn.execute("DELETE FROM suggestions WHERE created_at <= ?", (now - self.ttl_seconds,))
+            conn.execute(
+                "DELETE FROM suggestions WHERE key IN ("
+                " SELECT key FROM suggestions ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+        return True
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM suggestions")
+
+    def stats(self):
+        with self._lock, self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM suggestions").fetchone()[0]
+        return {"entries": entries, "hits": self.hits, "misses": self.misses}
@@ -0,0 +1,196 @@
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+# --- Template Index ---
+# Precomputed per-template data used to keep prompts small: where the
+# [Placeholder]s are, and a TF-IDF vector per clause so only the clauses
+# relevant to a scenario are sent to the model.
+PLACEHOLDER_RE = re.compile(r"\[([^\[\]\n]{1,80})\]")
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Concrete details a form value would replace in a filled-in sample: amounts, dates,
+# flat numbers, or "_____" blanks
+_DATA_RE = re.compile(r"\d|_{3,}")
+_STOPWORDS = frozenset("""
+    a an and any are as at be been by for from has have he her his i if in into is it its of on or our
+    shall she should such that the their them then there these they this those to was were which will
+    with would you your said hereto herein thereof hereby
+""".split())
+
+def tokenize(text):
+    return [t for t in _TOKEN_RE.findall((text or "").lower()) if len(t) > 1 and t not in _STOPWORDS]
+
+def placeholder_key(name):
+    # "[Licensor Name]", "licensor_name" and "LicensorName " all map to "licensor name"
+    spaced = re.sub(r"(?<=[a-z])(?=[A-Z])", " ", name)
+    return " ".join(_TOKEN_RE.findall(spaced.lower()))
+
+
+class IndexedTemplate:
+    def __init__(self, name, digest, mtime_ns, clauses):
+        self.name = name
+        self.digest = digest
+        self.mtime_ns = mtime_ns
+        self.clauses = clauses
+        self.placeholders = {}      # clause_id -> [{"placeholder", "key", "start", "end"}]
+        for clause in clauses:
+            found = [
+                {"placeholder": m.group(0), "key": placeholder_key(m.group(1)), "start": m.start(), "end": m.end()}
+                for m in PLACEHOLDER_RE.finditer(clause["text"])
+            ]
+            if found:
+                self.placeholders[clause["clause_id"]] = found
+
+        self.data_clauses = [i for i, clause in enumerate(clauses) if _DATA_RE.search(clause["text"])]
+        self._folded = [" ".join(clause["text"].lower().split()) for clause in clauses]
+
+        documents = [Counter(tokenize(clause["text"])) for clause in clauses]
+        self.terms = [set(terms) for terms in documents]
+        document_frequency = Counter(term for terms in documents for term in terms)
+        total = len(documents)
+        self.idf = {term: math.log((1 + total) / (1 + df)) + 1 for term, df in document_frequency.items()}
+        self.vectors = [self._vector(terms) for terms in documents]
+
+    def _vector(self, terms):
+        weights = {term: count * self.idf[term] for term, count in terms.items() if term in self.idf}
+        norm = math.sqrt(sum(w * w for w in weights.values()))
+        return {term: w / norm for term, w in weights.items()} if norm else {}
+
+    def rank(self, query_text):
+        # Clause positions ordered by cosine similarity to the query (ties keep document order)
+        query = self._vector(Counter(tokenize(query_text)))
+        scores = [
+            sum(weight * vector.get(term, 0.0) for term, weight in query.items())
+            for vector in self.vectors
+        ]
+        return sorted(range(len(self.clauses)), key=lambda i: -scores[i]), scores
+
+    def form_matches(self, form_data):
+        # Clause positions a form value belongs in: clauses carrying concrete details
+        # that mention a field name ("Security Deposit" -> "SECURITY DEPOSIT: ... Rs. 30,000"),
+        # and clauses that already contain a submitted value
+        matched = set()
+        for key, value in (form_data or {}).items():
+            value = " ".join(str(value).lower().split())
+            if not value:
+                continue
+            key_terms = set(tokenize(str(key)))
+            matched.update(i for i in self.data_clauses if key_terms & self.terms[i])
+            if len(value) >= 3:
+                matched.update(i for i, text in enumerate(self._folded) if value in text)
+        return matched
+
+    def fill_placeholders(self, form_data):
+        # Returns {clause_id: filled_text} for clauses where at least one placeholder had a value
+        values = {placeholder_key(str(key)): str(value).strip() for key, value in (form_data or {}).items()}
+        values = {key: value for key, value in values.items() if key and value}
+        filled = {}
+        for clause in self.clauses:
+            text = clause["text"]
+            pieces = []
+            last = 0
+            changed = False
+            for found in self.placeholders.get(clause["clause_id"], []):
+                value = values.get(found["key"])
+                if value is None:
+                    continue
+                pieces.append(text[last:found["start"]])
+                pieces.append(value)
+                last = found["end"]
+                changed = True
+            if changed:
+                pieces.append(text[last:])
+                filled[clause["clause_id"]] = "".join(pieces)
+        return filled
+
+
+class TemplateIndex:
+    def __init__(self, template_dir, doc_cache):
+        self.template_dir = template_dir
+        self.doc_cache = doc_cache
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        # Incremental: only templates whose mtime changed (or that are new) are re-indexed
+        try:
+            names = {f for f in os.listdir(self.template_dir) if f.endswith('.docx')}
+        except FileNotFoundError:
+            names = set()
+        for name in names:
+            try:
+                self.get(name)
+            except Exception as e:
+                print(f"Error indexing template {name}: {e}")
+        with self._lock:
+            for name in set(self._templates) - names:
+                del self._templates[name]
+
+    def get(self, name):
+        path = os.path.join(self.template_dir, name)
+        mtime_ns = os.stat(path).st_mtime_ns
+        with self._lock:
+            entry = self._templates.get(name)
+        if entry is not None and entry.mtime_ns == mtime_ns:
+            return entry
+        parsed = self.doc_cache.get_by_template(path)
+        entry = IndexedTemplate(name, parsed.digest, mtime_ns, parsed.clauses)
+        with self._lock:
+            self._templates[name] = entry
+        return entry
+
+    def find_by_digest(self, digest):
+        with self._lock:
+            for entry in self._templates.values():
+                if entry.digest == digest:
+                    return entry
+        return None
+
+    def names(self):
+        with self._lock:
+            return sorted(self._templates)
+
+
+# --- Targeted Prompting ---
+def plan_targeted_analysis(entry, scenario_text, form_data, top_k):
+    # Returns (model_clauses, local_suggestions, original_texts).
+    # Placeholders are filled locally as MODIFY suggestions. The model always sees clauses
+    # with placeholders or form-data matches (so values still get applied where the
+    # template has none), plus the top_k others most relevant to the scenario and form data.
+    filled = entry.fill_placeholders(form_data)
+    local_suggestions = [
+        {
+            "action": "MODIFY",
+            "clause_id": clause["clause_id"],
+            "original_text": clause["text"],
+            "new_text": filled[clause["clause_id"]],
+            "reason": "Filled in placeholders from the agreement details.",
+        }
+        for clause in entry.clauses if clause["clause_id"] in filled
+    ]
+
+    required = set(entry.form_matches(form_data))
+    required.update(i for i, clause in enumerate(entry.clauses) if clause["clause_id"] in entry.placeholders)
+    form_text = "\n".join(f"{key} {value}" for key, value in (form_data or {}).items() if str(value).strip())
+    order, _ = entry.rank(f"{scenario_text or ''}\n{form_text}")
+    selected = sorted(required.union([i for i in order if i not in required][:top_k]))
+    model_clauses = []
+    for position in selected:
+        clause = dict(entry.clauses[position])
+        clause["text"] = filled.get(clause["clause_id"], clause["text"])
+        model_clauses.append(clause)
+    original_texts = {clause["clause_id"]: clause["text"] for clause in entry.clauses}
+    return model_clauses, local_suggestions, original_texts
+
+def combine_targeted_suggestions(model_suggestions, local_suggestions, original_texts):
+    # The model saw filled-in text, so point its original_text back at the template
+    # paragraph; where it changed a clause itself, its version replaces the local fill.
+    touched = set()
+    for suggestion in model_suggestions:
+        clause_id = suggestion.get("clause_id") if isinstance(suggestion, dict) else None
+        if clause_id in original_texts and suggestion.get("action") in ("MODIFY", "REMOVE"):
+            suggestion["original_text"] = original_texts[clause_id]
+            touched.add(clause_id)
+    return [s for s in local_suggestions if s["clause_id"] not in touched] + list(model_suggestions)
@@ -103,6 +103,7 @@ const SuggestionCard = ({ suggestion, onUpdate, onEdit }) => {
 // --- MAIN APP COMPONENT --- //
 export default function App() {
     const [file, setFile] = useState(null);
+    const [templateName, setTemplateName] = useState(null);
     const [scenario, setScenario] = useState('');
     const [status, setStatus] = useState('idle');
     const [suggestions, setSuggestions] = useState([]);
@@ -134,6 +135,7 @@ export default function App() {
 
     const resetState = () => {
         setFile(null);
+        setTemplateName(null);
         setScenario('');
         setStatus('idle');
         setSuggestions([]);
@@ -156,16 +158,17 @@ export default function App() {
         }
     };
 
-    const handleFileChange = (e) => { if (e.target.files && e.target.files[0]) handleFileSelect(e.target.files[0]); };
-    const handleTemplateSelect = async (templateName) => {
-        try {
-            const response = await fetch(`http://localhost:5001/api/templates/${templateName}`);
-            if (!response.ok) throw new Error('Could not fetch template file');
-            const blob = await response.blob();
-            const selectedFile = new File([blob], templateName, { type: 'application/vnd.openxmlformats-officedocument.wordprocessingml.document' });
-            setSidebarOpen(false);
-            handleFileSelect(selectedFile);
-        } catch (error) { alert(`Could not load template: ${error.message}`); }
+    const handleFileChange = (e) => {
+        if (e.target.files && e.target.files[0]) {
+            setTemplateName(null);
+            handleFileSelect(e.target.files[0]);
+        }
+    };
+    const handleTemplateSelect = (selectedTemplate) => {
+        // Server-side templates are analyzed by name; no need to download and re-upload the file
+        setSidebarOpen(false);
+        setTemplateName(selectedTemplate);
+        handleFileSelect({ name: selectedTemplate });
     };
 
     const handleFormChange = (name, value) => { setFinalFormData(prev => ({ ...prev, [name]: value })); };
@@ -175,18 +178,52 @@ export default function App() {
         if (!file || !scenario) { alert("Please describe the scenario."); return; }
         setStatus('analyzing');
         const apiFormData = new FormData();
-        apiFormData.append('document', file);
+        if (templateName) apiFormData.append('templateName', templateName);
+        else apiFormData.append('document', file);
         apiFormData.append('scenario', scenario);
         apiFormData.append('formData', JSON.stringify(finalFormData));
         try {
-            const response = await fetch('http://localhost:5001/api/analyze', { method: 'POST', body: apiFormData });
+            // Suggestions arrive as server-sent events so the review list fills in while the model is still working
+            const response = await fetch('http://localhost:5001/api/analyze/stream', { method: 'POST', body: apiFormData });
             if (!response.ok) {
                 const errData = await response.json();
                 throw new Error(errData.error || 'Network response was not ok');
             }
-            const data = await response.json();
-            if (data.suggestions && data.suggestions[0]?.action === "ERROR") throw new Error(`AI Error: ${data.suggestions[0].reason}`);
-            setSuggestions((data.suggestions || []).map(s => ({ ...s, status: 'pending' })));
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = '';
+            let received = 0;
+            let firstError = null;
+            setSuggestions([]);
+            while (true) {
+                const { done, value } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                const events = buffer.split('\n\n');
+                buffer = events.pop();
+                for (const rawEvent of events) {
+                    const eventName = (rawEvent.match(/^event: (.*)$/m) || [])[1];
+                    const dataLine = (rawEvent.match(/^data: (.*)$/m) || [])[1];
+                    if (!eventName || dataLine === undefined) continue;
+                    const data = JSON.parse(dataLine);
+                    if (eventName === 'suggestion') {
+                        received += 1;
+                        setSuggestions(current => [...current, { ...data, status: 'pending' }]);
+                        setStatus('suggested');
+                    } else if (eventName === 'replace') {
+                        // The model rewrote a clause that was already filled in locally. Only that
+                        // MODIFY is swapped; an ADD anchored on the same clause_id must stay.
+                        const replacement = { ...data.suggestion, status: 'pending' };
+                        const isLocalFill = s => s.action === 'MODIFY' && s.clause_id === data.clause_id;
+                        setSuggestions(current => current.some(isLocalFill)
+                            ? current.map(s => (isLocalFill(s) ? replacement : s))
+                            : [...current, replacement]);
+                    } else if (eventName === 'error' && !firstError) {
+                        firstError = data.reason || data.error;
+                    }
+                }
+            }
+            if (received === 0 && firstError) throw new Error(`AI Error: ${firstError}`);
             setStatus('suggested');
         } catch (error) {
             console.error("Failed to analyze document:", error);